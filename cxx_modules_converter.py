@@ -4,20 +4,17 @@
 #
 from __future__ import annotations
 
-import argparse
+from functools import lru_cache
 import importlib.metadata
+import io
 from pathlib import Path
 import sys
+from types import SimpleNamespace
 
-from cxx_modules_converter_lib import (
-    Converter, 
-    ConvertAction,
-    COMPAT_MACRO_DEFAULT,
-    always_include_names,
-    ContentType,
-    Options,
-)
+VERSION_ARGS = (['-v'], ['--version'])
+READ_AHEAD_FILES = 8
 
+@lru_cache(maxsize=1)
 def get_version() -> str | None:
     try:
         metadata_version = importlib.metadata.version('cxx_modules_converter')
@@ -26,112 +23,239 @@ def get_version() -> str | None:
     except importlib.metadata.PackageNotFoundError:
         return 'not-installed'
 
+FAST_VALUE_ARGS: dict[str, str] = {
+    '-s': 'directory', '--directory': 'directory',
+    '-d': 'destination', '--destination': 'destination',
+    '-a': 'action', '--action': 'action',
+    '-r': 'root', '--root': 'root',
+    '-n': 'name', '--name': 'name',
+    '-j': 'jobs', '--jobs': 'jobs',
+}
+FAST_FLAG_ARGS: dict[str, str] = {
+    '-i': 'inplace', '--inplace': 'inplace',
+    '-p': 'parent', '--parent': 'parent',
+    '-q': 'quiet', '--quiet': 'quiet',
+}
+
+def default_args() -> SimpleNamespace:
+    from cxx_modules_converter_lib import (
+        ConvertAction,
+        COMPAT_MACRO_DEFAULT,
+        always_include_names,
+    )
+    directory = '.'
+    return SimpleNamespace(
+        directory=directory,
+        inplace=False,
+        destination=directory,
+        action=ConvertAction.MODULES,
+        root=directory,
+        parent=False,
+        include=[],
+        name='',
+        skip=[],
+        compat=[],
+        compat_macro=COMPAT_MACRO_DEFAULT,
+        header=list(always_include_names),
+        export=[],
+        exportsuffix=[],
+        inextheader=[],
+        inextcxx=[],
+        outextmod=None,
+        outextmodimpl=None,
+        jobs=1,
+        async_io=False,
+        quiet=False,
+        version=False,
+    )
+
+def parse_args_fast(argv: list[str]) -> SimpleNamespace | None:
+    '''parse common invocations using only simple options without building argparse parser.
+    returns None when full parser is needed - help, errors, other options or combined short flags'''
+    from cxx_modules_converter_lib import ConvertAction
+    parsed_args = default_args()
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        flag_dest = FAST_FLAG_ARGS.get(arg)
+        if flag_dest:
+            setattr(parsed_args, flag_dest, True)
+            i += 1
+            continue
+        value_dest = FAST_VALUE_ARGS.get(arg)
+        if not value_dest or i + 1 >= len(argv) or argv[i + 1].startswith('-'):
+            return None
+        setattr(parsed_args, value_dest, argv[i + 1])
+        i += 2
+    try:
+        parsed_args.action = ConvertAction(parsed_args.action)
+        parsed_args.jobs = int(parsed_args.jobs)
+    except ValueError:
+        return None
+    return parsed_args
+
 def parse_args(argv: list[str] | None = None):
+    if argv is None:
+        argv = sys.argv[1:]
+    parsed_args = parse_args_fast(argv)
+    if parsed_args:
+        return parsed_args
+    import argparse
+    from cxx_modules_converter_lib import (
+        ConvertAction,
+        ContentType,
+        Options,
+    )
     version = get_version()
     parser = argparse.ArgumentParser(
                     prog='cxx_modules_converter',
                     description=f'Convert C++20 modules to headers and headers to modules, version: {version}',
                     epilog='')
-    directory = '.'
     options = Options()
-    parser.add_argument('-s','--directory', default=directory, help='the directory with files')
-    parser.add_argument('-i', '--inplace', default=False, action='store_true', help='convert files in the same directory or put conversion result to destination')
-    parser.add_argument('-d', '--destination', default=directory, help='destination directory where to put conversion result, ignored when --inplace is provided')
-    parser.add_argument('-a', '--action', default=ConvertAction.MODULES, 
+    parser.add_argument('-s','--directory', help='the directory with files')
+    parser.add_argument('-i', '--inplace', action='store_true', help='convert files in the same directory or put conversion result to destination')
+    parser.add_argument('-d', '--destination', help='destination directory where to put conversion result, ignored when --inplace is provided')
+    parser.add_argument('-a', '--action', type=ConvertAction,
                         choices=[ConvertAction.MODULES, ConvertAction.HEADERS],
                         help='action to perform - convert to modules or headers')
-    parser.add_argument('-r', '--root', default=directory, help='resolve module names starting from this root directory, ignored when --parent')
-    parser.add_argument('-p', '--parent', action='store_true', default=False, help='resolve module names starting from parent of source directory')
-    parser.add_argument('-I', '--include', action='append', default=[], help='include search path, starting from root or parent directory')
-    parser.add_argument('-n', '--name', default='', help='module name for modules in [root] directory which prefixes all modules')
-    parser.add_argument('-k', '--skip', action='append', default=[], help='skip patterns - files and directories matching any pattern will not be converted or copied')
-    parser.add_argument('-c', '--compat', action='append', default=[],
+    parser.add_argument('-r', '--root', help='resolve module names starting from this root directory, ignored when --parent')
+    parser.add_argument('-p', '--parent', action='store_true', help='resolve module names starting from parent of source directory')
+    parser.add_argument('-I', '--include', action='append', help='include search path, starting from root or parent directory')
+    parser.add_argument('-n', '--name', help='module name for modules in [root] directory which prefixes all modules')
+    parser.add_argument('-k', '--skip', action='append', help='skip patterns - files and directories matching any pattern will not be converted or copied')
+    parser.add_argument('-c', '--compat', action='append',
                         help='compat patterns - files and directories matching any pattern'
                         + ' will be converted in compatibility mode allowing to use as either module or header')
-    parser.add_argument('-m', '--compat-macro', default=COMPAT_MACRO_DEFAULT, help='compatibility macro name used in compat modules and headers')
-    parser.add_argument('-e', '--header', action='append', default=always_include_names, help='always include headers with matching names and copy them as is')
-    parser.add_argument('--export', action='append', default=[], 
+    parser.add_argument('-m', '--compat-macro', help='compatibility macro name used in compat modules and headers')
+    parser.add_argument('-e', '--header', action='append', help='always include headers with matching names and copy them as is')
+    parser.add_argument('--export', action='append',
                         help='A=B means module A exports module B, i.e. `--export A=B` means module A will have `export import B;`.'
                         + ' use `--export "A=*"` to export all imports.'
                         + ' use `--export "*=B"` to export B from all modules.'
                         + ' use `--export "*=*"` to export all from all modules.'
                         )
-    parser.add_argument('--exportsuffix', action='append', default=[], help='export module suffix for which `export import` is used instead of simple `import`')
-    parser.add_argument('--inextheader', action='append', default=[], help='input header file extensions, .h by default. first use replaces the default, subsequent uses append.')
-    parser.add_argument('--inextcxx', action='append', default=[], help='input C++ source file extensions, .cpp by default. first use replaces the default, subsequent uses append.')
+    parser.add_argument('--exportsuffix', action='append', help='export module suffix for which `export import` is used instead of simple `import`')
+    parser.add_argument('--inextheader', action='append', help='input header file extensions, .h by default. first use replaces the default, subsequent uses append.')
+    parser.add_argument('--inextcxx', action='append', help='input C++ source file extensions, .cpp by default. first use replaces the default, subsequent uses append.')
     parser.add_argument('--outextmod', help=f'output module interface unit file extensions. default: {options.content_type_to_ext[ContentType.MODULE_INTERFACE]}')
     parser.add_argument('--outextmodimpl', help=f'output module implementation unit file extensions. default: {options.content_type_to_ext[ContentType.MODULE_IMPL]}')
-    parser.add_argument('-v', '--version', default=False, action='store_true', help='show version')
+    parser.add_argument('-j', '--jobs', type=int, help='number of worker processes converting files in parallel, 1 by default')
+    parser.add_argument('--async', dest='async_io', action='store_true',
+                        help=f'read next {READ_AHEAD_FILES} files in background while converting current one, ignored with --jobs')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not show options and conversion progress, only warnings')
+    parser.add_argument('-v', '--version', action='store_true', help='show version')
+    parser.set_defaults(**vars(default_args()))
     parsed_args = parser.parse_args(argv)
     return parsed_args
 
 def log(message: str):
-    print('cxx_modules_converter:', message)
+    sys.stdout.write(f'cxx_modules_converter: {message}\n')
 
 def main():
+    if isinstance(sys.stdout, io.TextIOWrapper) and not sys.stdout.isatty():
+        # avoid write per line when stdout is redirected, flushed once at exit.
+        # terminal keeps line buffering so that progress and warnings show up immediately
+        sys.stdout.reconfigure(line_buffering=False)
+    try:
+        return run()
+    finally:
+        sys.stdout.flush()
+
+def describe_args(parsed_args) -> list[str]:
+    log_messages: list[str] = []
+    log_messages.append(f'converting files of directory "{parsed_args.directory}" to {parsed_args.action} {"inplace" if parsed_args.inplace else " into " + parsed_args.destination}')
+    for include in parsed_args.include:
+        log_messages.append(f'include search path: "{include}"')
+    for skip_pattern in parsed_args.skip:
+        log_messages.append(f'skip pattern: "{skip_pattern}"')
+    for compat_pattern in parsed_args.compat:
+        log_messages.append(f'compat pattern: "{compat_pattern}"')
+    for header in parsed_args.header:
+        log_messages.append(f'header: "{header}"')
+    for export_pair in parsed_args.export:
+        owner, _, export = export_pair.partition('=')
+        log_messages.append(f'export: "{owner}" exports "{export}"')
+    for export_suffix in parsed_args.exportsuffix:
+        log_messages.append(f'export suffix: "{export_suffix}"')
+    for ext in parsed_args.inextheader:
+        log_messages.append(f'input header extension: "{ext}"')
+    for ext in parsed_args.inextcxx:
+        log_messages.append(f'input C++ source extension: "{ext}"')
+    if parsed_args.outextmod:
+        log_messages.append(f'output module interface unit extension: "{parsed_args.outextmod}"')
+    if parsed_args.outextmodimpl:
+        log_messages.append(f'output module implementation unit extension: "{parsed_args.outextmodimpl}"')
+    if parsed_args.jobs > 1:
+        log_messages.append(f'jobs: {parsed_args.jobs}')
+    elif parsed_args.async_io:
+        log_messages.append(f'read ahead: {READ_AHEAD_FILES} files')
+    return log_messages
+
+def run():
+    if sys.argv[1:] in VERSION_ARGS:
+        # shortcut for version only - avoid loading converter library and building the parser
+        log(f'{get_version()}')
+        return
     parsed_args = parse_args()
     if parsed_args.version:
         version = get_version()
         log(f'{version}')
         return
+    from cxx_modules_converter_lib import (
+        Converter,
+        ContentType,
+    )
     if not parsed_args.directory:
         log('--directory argument is required')
         return 1
-    log_messages: list[str] = []
-    log_messages.append(f'converting files of directory "{parsed_args.directory}" to {parsed_args.action} {"inplace" if parsed_args.inplace else " into " + parsed_args.destination}')
+    directory = Path(parsed_args.directory)
     if parsed_args.inplace:
-        destination = parsed_args.directory
+        destination = directory
     else:
-        destination = parsed_args.destination
-        assert(destination != parsed_args.directory)
-    directory = Path(parsed_args.directory)
+        destination = Path(parsed_args.destination)
+        if destination.resolve() == directory.resolve():
+            log('--destination must differ from --directory, use --inplace to convert files in the same directory')
+            return 1
     converter = Converter(parsed_args.action)
+    converter.verbose = not parsed_args.quiet
     if parsed_args.parent:
-        parsed_args.root = directory.parent
-    if parsed_args.root:
-        root_dir = Path(parsed_args.root)
-        converter.options.root_dir = root_dir
+        converter.options.root_dir = directory.parent
+    elif parsed_args.root:
+        converter.options.root_dir = Path(parsed_args.root)
     else:
         converter.options.root_dir = directory
     converter.options.root_dir_module_name = parsed_args.name
-    for include in parsed_args.include:
-        log_messages.append(f'include search path: "{include}"')
-        converter.options.search_path.append(include)
-    for skip_pattern in parsed_args.skip:
-        log_messages.append(f'skip pattern: "{skip_pattern}"')
-        converter.options.skip_patterns.append(skip_pattern)
-    for compat_pattern in parsed_args.compat:
-        log_messages.append(f'compat pattern: "{compat_pattern}"')
-        converter.options.compat_patterns.append(compat_pattern)
+    converter.options.search_path.extend(parsed_args.include)
+    converter.options.skip_patterns.extend(parsed_args.skip)
+    converter.options.compat_patterns.extend(parsed_args.compat)
     if parsed_args.compat_macro:
         converter.options.compat_macro = parsed_args.compat_macro
-    for header in parsed_args.header:
-        log_messages.append(f'header: "{header}"')
-        converter.options.always_include_names.append(header)
+    # parsed headers already start with the default names
+    converter.options.always_include_names = parsed_args.header
     for export_pair in parsed_args.export:
-        owner, export = export_pair.split('=')
-        log_messages.append(f'export: "{owner}" exports "{export}"')
+        owner, separator, export = export_pair.partition('=')
+        if not separator:
+            log(f'invalid --export value "{export_pair}", expected A=B')
+            return 1
         converter.options.add_export_module(owner, export)
-    for export_suffix in parsed_args.exportsuffix:
-        log_messages.append(f'export suffix: "{export_suffix}"')
-        converter.options.export_suffixes.append(export_suffix)
+    converter.options.export_suffixes.extend(parsed_args.exportsuffix)
     for ext in parsed_args.inextheader:
-        log_messages.append(f'input header extension: "{ext}"')
         converter.options.add_module_action_ext_type(ext, ContentType.HEADER)
     for ext in parsed_args.inextcxx:
-        log_messages.append(f'input C++ source extension: "{ext}"')
         converter.options.add_module_action_ext_type(ext, ContentType.CXX)
     if parsed_args.outextmod:
-        ext = parsed_args.outextmod
-        log_messages.append(f'output module interface unit extension: "{ext}"')
-        converter.options.set_output_content_type_to_ext(ContentType.MODULE_INTERFACE, ext)
+        converter.options.set_output_content_type_to_ext(ContentType.MODULE_INTERFACE, parsed_args.outextmod)
     if parsed_args.outextmodimpl:
-        ext = parsed_args.outextmodimpl
-        log_messages.append(f'output module implementation unit extension: "{ext}"')
-        converter.options.set_output_content_type_to_ext(ContentType.MODULE_IMPL, ext)
-    log_text = '\n'.join(log_messages)
+        converter.options.set_output_content_type_to_ext(ContentType.MODULE_IMPL, parsed_args.outextmodimpl)
+    converter.jobs = parsed_args.jobs
+    if parsed_args.async_io:
+        converter.read_ahead = READ_AHEAD_FILES
+    if parsed_args.quiet:
+        converter.convert_directory(directory, destination)
+        return
+    log_text = '\n'.join(describe_args(parsed_args))
     log(log_text)
-    converter.convert_directory(directory, Path(destination))
+    converter.convert_directory(directory, destination)
     log(log_text)
     log(f'done, all: {converter.all_files}, convertable: {converter.convertable_files}, converted: {converter.converted_files}, copied: {converter.copied_files} ')
 
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from collections.abc import Callable
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
 import copy
 import enum
 import os
@@ -8,8 +9,11 @@ import os.path
 from pathlib import Path, PurePosixPath
 import re
 import shutil
+import sys
 
-from typing import Any, cast
+from typing import Any, cast, TYPE_CHECKING
+if TYPE_CHECKING:
+    from concurrent.futures import Future
 try:
     # make pylance happy
     from typing import TypeAlias as TypeAlias2
@@ -32,44 +36,193 @@ always_include_names = [
 
 COMPAT_MACRO_DEFAULT: str = "CXX_COMPAT_HEADER"
 STAR_MODULE_EXPORT: str = '*'
+IO_BUFFER_SIZE_DEFAULT: int = 1 << 20
+JOB_BATCHES_PER_WORKER: int = 4 # tasks per worker process when converting with jobs > 1
 
-class ContentType(enum.Enum):
+class ContentType(enum.IntEnum):
+    '''int valued so that dicts keyed by content type hash it as int'''
     HEADER = 1
     CXX = 2
     MODULE_INTERFACE = 3
     MODULE_IMPL = 4
     OTHER = 5
 
+    def __str__(self) -> str:
+        # same as plain enum, IntEnum would print the number
+        return f'{type(self).__name__}.{self.name}'
+
 ExtTypes: TypeAlias = dict[str, ContentType]
 ContentTypeToExt: TypeAlias = dict[ContentType, str]
 
+def glob_class_to_regex(part: str, i: int, j: int) -> str:
+    '''translate [...] character class of glob part[i:j] (without brackets) to regex never matching "/".
+    same ranges and escaping as fnmatch.translate'''
+    stuff = part[i:j]
+    if '-' not in stuff:
+        stuff = stuff.replace('\\', r'\\')
+    else:
+        chunks = []
+        k = i+2 if part[i] == '!' else i+1
+        while True:
+            k = part.find('-', k, j)
+            if k < 0:
+                break
+            chunks.append(part[i:k])
+            i = k+1
+            k = k+3
+        chunk = part[i:j]
+        if chunk:
+            chunks.append(chunk)
+        else:
+            chunks[-1] += '-'
+        # remove empty ranges, invalid in regex
+        for k in range(len(chunks)-1, 0, -1):
+            if chunks[k-1][-1] > chunks[k][0]:
+                chunks[k-1] = chunks[k-1][:-1] + chunks[k][1:]
+                del chunks[k]
+        # escape backslashes and hyphens not creating ranges
+        stuff = '-'.join(s.replace('\\', r'\\').replace('-', r'\-') for s in chunks)
+    # escape set operations &&, ~~ and ||
+    stuff = re.sub(r'([&~|])', r'\\\1', stuff)
+    if not stuff:
+        # empty range never matches
+        return '(?!)'
+    if stuff == '!':
+        # negated empty range matches any character
+        return '[^/]'
+    if stuff[0] == '!':
+        stuff = '^' + stuff[1:]
+    elif stuff[0] in ('^', '['):
+        stuff = '\\' + stuff
+    # ranges may include "/", which never is part of path component
+    return f'(?!/)[{stuff}]'
+
+def glob_part_to_regex(part: str) -> str:
+    '''translate single path component glob pattern to regex, wildcards never match "/"'''
+    result: list[str] = []
+    i = 0
+    n = len(part)
+    while i < n:
+        c = part[i]
+        i += 1
+        if c == '*':
+            result.append('[^/]*')
+        elif c == '?':
+            result.append('[^/]')
+        elif c == '[':
+            j = i
+            if j < n and part[j] == '!':
+                j += 1
+            if j < n and part[j] == ']':
+                j += 1
+            while j < n and part[j] != ']':
+                j += 1
+            if j >= n:
+                result.append('\\[')
+                continue
+            result.append(glob_class_to_regex(part, i, j))
+            i = j + 1
+        else:
+            result.append(re.escape(c))
+    return ''.join(result)
+
+def glob_to_regex(pattern: str) -> str:
+    '''translate glob pattern to regex matching same posix paths as PurePosixPath.match() does.
+    patterns without parts like "." or "./" never match, PurePosixPath.match() raises ValueError for them'''
+    if not pattern:
+        raise ValueError('empty pattern')
+    parts = [part for part in pattern.split('/') if part and part != '.']
+    if not parts:
+        return '(?!)'
+    body = '/'.join(glob_part_to_regex(part) for part in parts)
+    if pattern.startswith('/'):
+        return f'^/{body}$'
+    return f'(?:^|/){body}$'
+
+def compile_patterns(patterns: Iterable[str]) -> re.Pattern[str] | None:
+    '''compile glob patterns into single regex, None if there are no patterns'''
+    alternatives = [f'(?:{glob_to_regex(pattern)})' for pattern in patterns]
+    if not alternatives:
+        return None
+    return re.compile('|'.join(alternatives))
+
+glob_special_chars_rx = re.compile(r'''[*?\[/]''')
+
+class PatternsMatcher:
+    '''matches posix filenames against glob patterns compiled once into single regex.
+    plain file names without wildcards are matched by set lookup of the last path part.
+    recompiles only when the patterns list changes'''
+    def __init__(self):
+        self.compiled_patterns: list[str] = []
+        self.names: frozenset[str] = frozenset()
+        self.rx: re.Pattern[str] | None = None
+
+    def matches(self, patterns: list[str], filename: str) -> bool:
+        if self.compiled_patterns != patterns:
+            self.compile(patterns)
+        return self.matches_compiled(filename)
+
+    def matches_compiled(self, filename: str) -> bool:
+        '''matches against patterns of last compile'''
+        if self.names and filename.rpartition('/')[2] in self.names:
+            return True
+        return self.rx is not None and self.rx.search(filename) is not None
+
+    def compile(self, patterns: list[str]):
+        is_name = lambda pattern: pattern and pattern != '.' and not glob_special_chars_rx.search(pattern)
+        self.names = frozenset(pattern for pattern in patterns if is_name(pattern))
+        self.rx = compile_patterns(pattern for pattern in patterns if not is_name(pattern))
+        self.compiled_patterns = list(patterns)
+
 class Options:
     def __init__(self):
-        self.always_include_names = copy.copy(always_include_names)
+        self.always_include_names = list(always_include_names)
         self.root_dir: Path = Path()
         self.root_dir_module_name: str = ''
         self.search_path: list[str] = []
         self.skip_patterns: list[str] = []
         self.compat_patterns: list[str] = []
-        self.compat_macro: str = COMPAT_MACRO_DEFAULT
+        self.compat_macro = COMPAT_MACRO_DEFAULT
         self.export: dict[str, set[str]] = {}
         self.export_suffixes: list[str] = []
+        self.io_buffer_size: int = IO_BUFFER_SIZE_DEFAULT # buffer size for reading and writing converted files
         self.modules_ext_types: ExtTypes = {
             '.h': ContentType.HEADER,
             '.cpp': ContentType.CXX,
         }
-        self._modules_ext_types_is_default = set(self.modules_ext_types.values())
+        self._modules_default_type_to_ext: dict[ContentType, str] = {type: ext for ext, type in self.modules_ext_types.items()}
         self.headers_ext_types: ExtTypes = {
             '.cppm': ContentType.MODULE_INTERFACE,
             '.cpp': ContentType.MODULE_IMPL,
         }
-        self._headers_ext_types_is_default = set(self.headers_ext_types.values())
+        self._headers_default_type_to_ext: dict[ContentType, str] = {type: ext for ext, type in self.headers_ext_types.items()}
         self.content_type_to_ext: ContentTypeToExt = {
             ContentType.HEADER: '.h',
             ContentType.CXX: '.cpp',
             ContentType.MODULE_INTERFACE: '.cppm',
             ContentType.MODULE_IMPL: '.cpp',
         }
+        self._skip_patterns_matcher = PatternsMatcher()
+        self._compat_patterns_matcher = PatternsMatcher()
+        self._always_include_matcher = PatternsMatcher()
+
+    @property
+    def compat_macro(self) -> str:
+        return self._compat_macro
+
+    @compat_macro.setter
+    def compat_macro(self, compat_macro: str):
+        self._compat_macro: str = compat_macro
+        self.compat_macro_ifndef: str = f'''#ifndef {compat_macro}''' # shared by all compat wrappers
+
+    def matches_skip_patterns(self, filename: str) -> bool:
+        return self._skip_patterns_matcher.matches(self.skip_patterns, filename)
+
+    def matches_compat_patterns(self, filename: str) -> bool:
+        return self._compat_patterns_matcher.matches(self.compat_patterns, filename)
+
+    def matches_always_include(self, filename: str) -> bool:
+        return self._always_include_matcher.matches(self.always_include_names, filename)
 
     def add_export_module(self, owner: str, export: str):
         owner_exports = self.export.setdefault(owner, set())
@@ -78,25 +231,19 @@ class Options:
     def add_module_action_ext_type(self, ext: str, type: ContentType):
         if not ext.startswith('.'):
             ext = '.' + ext
-        if type in self._modules_ext_types_is_default:
-            # first add replaces the default
-            self._modules_ext_types_is_default.remove(type)
-            for e in self.modules_ext_types:
-                if self.modules_ext_types[e] == type:
-                    del self.modules_ext_types[e]
-                    break
+        # first add replaces the default
+        default_ext = self._modules_default_type_to_ext.pop(type, None)
+        if default_ext is not None and self.modules_ext_types.get(default_ext) == type:
+            del self.modules_ext_types[default_ext]
         self.modules_ext_types[ext] = type
 
     def add_header_action_ext_type(self, ext: str, type: ContentType):
         if not ext.startswith('.'):
             ext = '.' + ext
-        if type in self._headers_ext_types_is_default:
-            # first add replaces the default
-            self._headers_ext_types_is_default.remove(type)
-            for e in self.headers_ext_types:
-                if self.headers_ext_types[e] == type:
-                    del self.headers_ext_types[e]
-                    break
+        # first add replaces the default
+        default_ext = self._headers_default_type_to_ext.pop(type, None)
+        if default_ext is not None and self.headers_ext_types.get(default_ext) == type:
+            del self.headers_ext_types[default_ext]
         self.headers_ext_types[ext] = type
 
     def set_output_content_type_to_ext(self, type: ContentType, ext: str):
@@ -106,12 +253,52 @@ class Options:
         self.content_type_to_ext[type] = ext
 
 class FileOptions:
+    __slots__ = ('convert_as_compat',)
+
     def __init__(self):
         self.convert_as_compat: bool = False
 
-def filename_to_module_name(filename: PurePosixPath) -> str:
-    parts = os.path.splitext(filename)
-    result = parts[0].replace('/', '.').replace('\\', '.')
+def normalize_posix_path(path: str) -> str:
+    '''same string as PurePosixPath(path).as_posix() without constructing path for already normalized paths'''
+    if (path and path != '/' and not path.endswith(('/', '/.'))
+        and not path.startswith('./') and '//' not in path and '/./' not in path):
+        return path
+    return PurePosixPath(path).as_posix()
+
+def join_posix_path(directory: str, filename: str) -> str:
+    '''same string as PurePosixPath(directory).joinpath(filename).as_posix() for normalized paths'''
+    if directory == '.' or filename.startswith('/'):
+        return filename
+    if filename == '.':
+        return directory
+    if directory.endswith('/'):
+        return directory + filename
+    return f'{directory}/{filename}'
+
+def split_extension(filename: str) -> tuple[str, str]:
+    '''same as os.path.splitext for str filename, without its generic path handling'''
+    dot = filename.rfind('.')
+    if dot <= 0:
+        return filename, ''
+    name_start = max(filename.rfind('/'), filename.rfind(os.sep)) + 1
+    if dot <= name_start:
+        return filename, ''
+    if filename[name_start] == '.' and not filename[name_start:dot].lstrip('.'):
+        # leading dots of the name are not extension separators
+        return filename, ''
+    return filename[:dot], filename[dot:]
+
+def posix_path_prefix(directory: str) -> str:
+    '''prefix of normalized directory to which normalized relative path is concatenated'''
+    if directory == '.':
+        return ''
+    if directory.endswith('/'):
+        return directory
+    return directory + '/'
+
+def filename_to_module_name(filename: str | PurePosixPath) -> str:
+    stem, _ = split_extension(str(filename))
+    result = stem.replace('/', '.').replace('\\', '.')
     return result
 
 class FileEntryType(enum.Enum):
@@ -123,10 +310,27 @@ FilesMapDict: TypeAlias = dict[str, "FilesMapDict | FileEntryType"]
 class FilesMap:
     def __init__(self):
         self.value: FilesMapDict = {}
+        # flat posix paths of all files and directories in value for fast lookup
+        self.files: set[str] = set()
+        self.dirs: set[str] = set()
+        self.generation: int = 0 # incremented on every change, used to invalidate lookups cached by users
+
+    def find(self, path: str | PurePosixPath) -> FilesMapDict | FileEntryType | None:
+        '''path is either PurePosixPath or normalized posix path string'''
+        path_str = path if type(path) is str else cast(PurePosixPath, path).as_posix()
+        if path_str in self.files:
+            return FileEntryType.FILE
+        if path_str not in self.dirs:
+            return None
+        return self.find_node(path_str)
 
-    def find(self, path: PurePosixPath) -> FilesMapDict | FileEntryType | None:
+    def find_node(self, path: str | PurePosixPath) -> FilesMapDict | FileEntryType | None:
+        if type(path) is str:
+            parts = path.split('/') if path != '.' else []
+        else:
+            parts = cast(PurePosixPath, path).parts
         value: FilesMapDict = self.value
-        for part in path.parts:
+        for part in parts:
             if not value:
                 break
             nextValue = value.get(part, None)
@@ -136,22 +340,48 @@ class FilesMap:
         return value
 
     def add_filesystem_directory(self, path: Path):
-        for (root, dirs, files) in os.walk(path):
-            relative_root = Path(os.path.relpath(root, path))
-            if relative_root == Path(''):
-                root_node: FilesMapDict = self.value
-            else:
-                parent_node = self.find(PurePosixPath(relative_root.parent))
-                assert(type(parent_node) is dict)
-                root_node = parent_node[relative_root.name] = {}
-
-            for name in dirs:
-                root_node[name] = {}
-            for name in files:
-                root_node[name] = FileEntryType.FILE
+        '''scans directory tree depth first carrying map node of each directory,
+        like os.walk symlinked directories are added but not followed and unreadable directories are skipped'''
+        dirs_to_scan: list[tuple[str, FilesMapDict]] = [(os.fspath(path), self.value)]
+        while dirs_to_scan:
+            dir_path, dir_node = dirs_to_scan.pop()
+            try:
+                entries = os.scandir(dir_path)
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if not is_dir:
+                        dir_node[entry.name] = FileEntryType.FILE
+                        continue
+                    child_node: FilesMapDict = {}
+                    dir_node[entry.name] = child_node
+                    if not entry.is_symlink():
+                        dirs_to_scan.append((entry.path, child_node))
+        self._update_paths()
     
     def add_files_map_dict(self, other: FilesMapDict):
         self.value.update(other)
+        self._update_paths()
+
+    def _update_paths(self):
+        self.generation += 1
+        self.files = set()
+        self.dirs = {'.'}
+        nodes: list[tuple[str, FilesMapDict]] = [('', self.value)]
+        while nodes:
+            prefix, node = nodes.pop()
+            for name, entry in node.items():
+                entry_path = prefix + name
+                if type(entry) is dict:
+                    self.dirs.add(entry_path)
+                    nodes.append((entry_path + '/', entry))
+                else:
+                    self.files.add(entry_path)
 
 ActionExtTypes: TypeAlias = dict[ConvertAction, ExtTypes]
 
@@ -167,43 +397,85 @@ class FilesResolver:
             ConvertAction.HEADERS: self.options.modules_ext_types,
             ConvertAction.MODULES: self.options.headers_ext_types,
         }
-    
+        # caches of resolved includes and module names, valid for cached_state
+        self._resolve_cache: dict[tuple[Path | None, str, bool], tuple[PurePosixPath | None, bool]] = {}
+        self._module_name_cache: dict[str, str] = {}
+        self._search_path_prefixes: list[str] = []
+        self._cached_state: tuple[FilesMap, int, str, list[str]] = (self.files_map, self.files_map.generation, '', [])
+
+    def _validate_caches(self):
+        files_map, generation, root_dir_module_name, search_path = self._cached_state
+        if (files_map is not self.files_map
+            or generation != self.files_map.generation
+            or root_dir_module_name != self.options.root_dir_module_name
+            or search_path != self.options.search_path):
+            self._resolve_cache = {}
+            self._module_name_cache = {}
+            self._search_path_prefixes = [posix_path_prefix(normalize_posix_path(item)) for item in self.options.search_path]
+            self._cached_state = (self.files_map, self.files_map.generation, self.options.root_dir_module_name, list(self.options.search_path))
+
     def resolve_in_search_path(self, current_dir: Path, current_filename: str|Path, include_filename: str, is_quote: bool) -> PurePosixPath | None:
-        include_path = PurePosixPath(include_filename)
+        self._validate_caches()
+        # only quote includes depend on current_dir
+        key = (current_dir if is_quote else None, include_filename, is_quote)
+        cached = self._resolve_cache.get(key)
+        if cached is None:
+            cached = self._resolve_cache[key] = self._resolve_in_search_path(current_dir, include_filename, is_quote)
+        result, found = cached
+        if not found and is_quote:
+            print(f'warning: file not found: "{include_filename}" referenced from "{current_filename}"')
+        return result
+
+    def _resolve_in_search_path(self, current_dir: Path, include_filename: str, is_quote: bool) -> tuple[PurePosixPath | None, bool]:
+        '''returns resolved include and whether it was found in files map'''
+        include_str = normalize_posix_path(include_filename)
         # search relative to root
-        if self.files_map.find(include_path):
-            return include_path
+        if self.files_map.find(include_str):
+            return PurePosixPath(include_str), True
         # search relative to current_dir
-        full_path = PurePosixPath(current_dir.joinpath(include_path))
-        if is_quote and self.files_map.find(full_path):
-            return full_path
+        if is_quote:
+            full_str = join_posix_path(current_dir.as_posix(), include_str)
+            if self.files_map.find(full_str):
+                return PurePosixPath(full_str), True
         # search in search_path
-        for search_path_item in self.options.search_path:
-            path = PurePosixPath(search_path_item).joinpath(include_path)
-            if self.files_map.find(path):
-                return path
+        # absolute include is not joined to search path and was already looked up as is
+        if not include_str.startswith('/'):
+            for search_path_prefix in self._search_path_prefixes:
+                if include_str != '.':
+                    path_str = search_path_prefix + include_str
+                else:
+                    path_str = normalize_posix_path(search_path_prefix or '.')
+                if self.files_map.find(path_str):
+                    return PurePosixPath(path_str), True
         if is_quote:
-            print(f'warning: file not found: "{include_filename}" referenced from "{current_filename}"')
-            return include_path
-        return None
+            return PurePosixPath(include_str), False
+        return None, False
+
+    def convert_filename_to_module_name(self, filename: str | PurePosixPath) -> str:
+        '''filename is either PurePosixPath or posix path string'''
+        self._validate_caches()
+        filename_str = normalize_posix_path(filename) if type(filename) is str else cast(PurePosixPath, filename).as_posix()
+        module_name = self._module_name_cache.get(filename_str)
+        if module_name is None:
+            module_name = self._module_name_cache[filename_str] = self._convert_filename_to_module_name(filename_str)
+        return module_name
 
-    def convert_filename_to_module_name(self, filename: PurePosixPath) -> str:
+    def _convert_filename_to_module_name(self, filename: str) -> str:
         full_name = filename
         if self.options.root_dir_module_name and self.files_map.find(filename):
-            full_name = PurePosixPath(self.options.root_dir_module_name).joinpath(filename)
+            full_name = join_posix_path(normalize_posix_path(self.options.root_dir_module_name), filename)
         module_name = filename_to_module_name(full_name)
         return module_name
 
-    def get_source_content_type(self, action: ConvertAction, filename: Path) -> ContentType:
-        parts = os.path.splitext(filename)
-        extension = parts[-1]
+    def get_source_content_type(self, action: ConvertAction, filename: str|Path) -> ContentType:
+        _, extension = split_extension(str(filename))
         action_ext_types = self.source_ext_types[action]
         return action_ext_types.get(extension, ContentType.OTHER)
 
     def convert_filename_to_content_type(self, filename: Path, content_type: ContentType) -> str:
-        parts = os.path.splitext(filename)
+        stem, _ = split_extension(str(filename))
         new_extension = self.options.content_type_to_ext[content_type]
-        new_filename = parts[0] + new_extension
+        new_filename = stem + new_extension
         return new_filename
 
 class ModuleFilesResolver:
@@ -222,11 +494,10 @@ class ModuleFilesResolver:
         return result
 
     def resolve_include_to_module_name(self, include_filename: str, is_quote: bool) -> str | None:
-        resolved_include_filename = self.parent_resolver.resolve_in_search_path(self.module_dir, self.module_filename, include_filename, is_quote)
+        resolved_include_filename = self.resolve_include(include_filename, is_quote)
         if resolved_include_filename is None:
             return None
-        result = self.parent_resolver.convert_filename_to_module_name(resolved_include_filename)
-        return result
+        return self.parent_resolver.convert_filename_to_module_name(resolved_include_filename)
 
 ContentTypeToName: TypeAlias = dict[ContentType, str]
 content_type_to_name: ContentTypeToName = {
@@ -250,16 +521,22 @@ def get_converted_content_type(content_type: ContentType) -> ContentType:
     return content_type_to_converted[content_type]
 
 class FileContent:
+    __slots__ = ('filename', 'content_type', 'content')
+
     def __init__(self, filename: str|Path, content_type: ContentType, content: str):
-        self.filename: Path = Path(filename)
+        self.filename: Path = filename if isinstance(filename, Path) else Path(filename)
         self.content_type: ContentType = content_type
         self.content: str = content
 
     def __repr__(self):
-        return str(self.__dict__)
+        return str({'filename': self.filename, 'content_type': self.content_type, 'content': self.content})
 
     def __eq__(self, other: object):
-        return self.__dict__ == other.__dict__
+        if not isinstance(other, FileContent):
+            return NotImplemented
+        return (self.content_type == other.content_type
+                and self.filename == other.filename
+                and self.content == other.content)
 
 FileContentList: TypeAlias = list[FileContent]
 
@@ -271,32 +548,52 @@ class LineCompatibility(enum.Enum):
     MODULE_CONTENT = 2
     ANY = 3
 
-# regex: spaces only
-spaces_rx = re.compile(r'''^\s*$''')
-# regex: #include <brackets_header.h>
-preprocessor_include_brackets_rx = re.compile(r'''^(\s*)#(\s*)include\s*<(.+)>(.*)$''')
-# regex: #include "quote_header.h"
-preprocessor_include_quote_rx = re.compile(r'''^(\s*)#(\s*)include\s*"(.+)"(.*)$''')
-# regex: line comment
-preprocessor_line_comment_rx = re.compile(r'''^\s*//.*$''')
-# regex: block comment start
-preprocessor_block_comment_rx = re.compile(r'''^\s*/\*.*$''')
-# regex: block comment end
-preprocessor_block_comment_rx = re.compile(r'''^\s*\*/.*$''')
-# regex: #if
-preprocessor_if_rx = re.compile(r'''^\s*#\s*if.*''')
-# regex: #endif
-preprocessor_endif_rx = re.compile(r'''^\s*#\s*endif.*$''')
-# regex: #define
-preprocessor_define_rx = re.compile(r'''^\s*#\s*define.*''')
-# regex: #error
-# regex: #elif
-# regex: #else
-# regex: #pragma
-# regex: #warning
-preprocessor_other_rx = re.compile(r'''^\s*#\s*(error|elif|else|pragma|warning).*''')
-# regex: #pragma once
-preprocessor_pragma_once_rx = re.compile(r'''^\s*#\s*pragma\s+once.*$''')
+# regex: preprocessor and comment lines in the order the scanner checks them:
+#   #include <brackets_header.h> or #include "quote_header.h"
+#   #pragma once
+#   line comment, #error, #elif, #else, #pragma, #warning, #define, spaces only
+#   #if
+#   #endif
+preprocessor_line_rx = re.compile(
+    r'''^(?:(?P<include>(?P<lead>\s*)#(?P<space>\s*)include\s*(?:<(?P<bhdr>.+)>|"(?P<qhdr>.+)")(?P<tail>.*)$)'''
+    r'''|(?P<pragma_once>\s*#\s*pragma\s+once.*$)'''
+    r'''|(?P<preprocessor>\s*//.*$|\s*#\s*(?:error|elif|else|pragma|warning|define).*|\s*$)'''
+    r'''|(?P<preprocessor_if>\s*#\s*if.*)'''
+    r'''|(?P<preprocessor_endif>\s*#\s*endif.*$))''')
+
+match_preprocessor_line = preprocessor_line_rx.match
+
+class LineKind(enum.Enum):
+    MAIN = 'main'
+    INCLUDE_BRACKETS = 'include_brackets'
+    INCLUDE_QUOTE = 'include_quote'
+    PRAGMA_ONCE = 'pragma_once'
+    PREPROCESSOR = 'preprocessor'
+    PREPROCESSOR_IF = 'preprocessor_if'
+    PREPROCESSOR_ENDIF = 'preprocessor_endif'
+
+directive_prefixes = ('#', '//')
+line_kinds_by_group: dict[str | None, LineKind] = {kind.value: kind for kind in LineKind}
+
+def classify_line(line: str) -> tuple[LineKind, re.Match[str] | None]:
+    '''classify source line, match is returned only for lines classified by preprocessor_line_rx'''
+    # most lines either start with code or are indented, strip only the indented ones
+    stripped = line if line and not line[0].isspace() else line.lstrip()
+    if not stripped:
+        return LineKind.PREPROCESSOR, None
+    if not stripped.startswith(directive_prefixes):
+        # neither directive nor line comment
+        return LineKind.MAIN, None
+    if stripped[0] != '#' and '\n' not in stripped:
+        # single line comment, continued comment lines are left to the regex
+        return LineKind.PREPROCESSOR, None
+    match = match_preprocessor_line(line)
+    if match is None:
+        return LineKind.MAIN, None
+    kind = match.lastgroup
+    if kind == 'include':
+        return (LineKind.INCLUDE_BRACKETS if match['bhdr'] is not None else LineKind.INCLUDE_QUOTE), match
+    return line_kinds_by_group[kind], match
 
 class FileBaseBuilder:
     content_type: ContentType = ContentType.OTHER
@@ -326,6 +623,8 @@ class ModuleBaseBuilder(FileBaseBuilder):
     def __init__(self, options: Options, parent_resolver: FilesResolver, file_options: FileOptions):
         super().__init__(options, parent_resolver)
         self.file_options: FileOptions = file_options
+        # content type and file options do not change after construction
+        self._is_compat_header: bool = file_options.convert_as_compat and self.content_type == ContentType.MODULE_INTERFACE
         self.resolver: ModuleFilesResolver = ModuleFilesResolver(self.parent_resolver, self.options)
         self.module_name: str = ''                   # name of the module
         self.file_copyright: StrList = []            # // File copyright
@@ -350,7 +649,7 @@ class ModuleBaseBuilder(FileBaseBuilder):
     def set_source_filename(self, source_filename: Path):
         super().set_source_filename(source_filename)
         self.resolver.set_filename(source_filename)
-        self.set_module_name(self.parent_resolver.convert_filename_to_module_name(PurePosixPath(source_filename)))
+        self.set_module_name(self.parent_resolver.convert_filename_to_module_name(source_filename.as_posix()))
 
     def set_module_name(self, name: str):
         assert(not self.module_name)
@@ -371,9 +670,9 @@ class ModuleBaseBuilder(FileBaseBuilder):
             return
         if not self.get_is_actually_module():
             return
-        if self.convert_as_compat_header():
+        if self._is_compat_header:
             self.global_module_fragment_start = [
-                f'''#ifndef {self.options.compat_macro}''',
+                self.options.compat_macro_ifndef,
                 f'''module;''',
                 f'''#else''',
                 f'''#pragma once''',
@@ -405,11 +704,10 @@ class ModuleBaseBuilder(FileBaseBuilder):
         self.flushed_global_module_fragment_includes_count = 0
         if self.preprocessor_nesting_count != 0:
             return
-        if self.global_module_fragment_includes_count == 0 and not self.convert_as_compat_header():
+        if self.global_module_fragment_includes_count == 0 and not self._is_compat_header:
             return
         self.set_global_module_fragment_start()
-        for line in self.global_module_fragment_staging:
-            self.global_module_fragment.append(line)
+        self.global_module_fragment.extend(self.global_module_fragment_staging)
         self.global_module_fragment_staging = []
         self.flushed_global_module_fragment_includes_count = self.global_module_fragment_includes_count
         self.global_module_fragment_includes_count = 0
@@ -469,9 +767,8 @@ class ModuleBaseBuilder(FileBaseBuilder):
             # wrap in #ifdef CXX_COMPAT_HEADER/#endif
             module_start = self.wrap_in_compat_macro_if_compat_header(module_start)
             module_end = self.wrap_in_compat_macro_if_compat_header(module_end)
-        for line in reversed(module_start):
-            self.module_content.insert(self.main_module_content_index, line)
-        self.module_content = self.module_content + module_end
+        self.module_content[self.main_module_content_index:self.main_module_content_index] = module_start
+        self.module_content.extend(module_end)
 
     def add_module_content(self, line: str):
         self._flush_module_staging()
@@ -489,71 +786,62 @@ class ModuleBaseBuilder(FileBaseBuilder):
     def _flush_module_staging(self, last_unnested_inserter: Callable[[], None] | None = None):
         self.set_module_purview_start()
         if self.flushed_global_module_fragment_includes_count == 0 or self.flushed_module_preprocessor_nesting_count != 0:
-            for i in range(len(self.module_staging)):
-                if last_unnested_inserter and i == self.module_staging_last_unnested_index:
-                    last_unnested_inserter()
-                line = self.module_staging[i]
-                self.module_content.append(line)
-            if last_unnested_inserter and self.module_staging_last_unnested_index == len(self.module_staging):
+            if last_unnested_inserter:
+                # staged lines before and after last unnested index are copied as two slices around inserter call
+                last_unnested_index = self.module_staging_last_unnested_index
+                self.module_content.extend(self.module_staging[:last_unnested_index])
                 last_unnested_inserter()
+                self.module_content.extend(self.module_staging[last_unnested_index:])
+            else:
+                self.module_content.extend(self.module_staging)
         self.module_staging = []
         self.flushed_module_preprocessor_nesting_count = self.preprocessor_nesting_count
         self.flushed_global_module_fragment_includes_count = 0
         self.module_staging_last_unnested_index = 0
 
-    def convert_as_compat_header(self):
-        return self.file_options.convert_as_compat and self.content_type == ContentType.MODULE_INTERFACE
+    def convert_as_compat_header(self) -> bool:
+        return self._is_compat_header
 
     def wrap_in_compat_macro_if_compat_header(self, lines: StrList):
-        if self.convert_as_compat_header():
+        if self._is_compat_header:
             return [
-                f'''#ifndef {self.options.compat_macro}''',
-            ] + lines + [
-                f'''#endif''', # end compat_macro
+                self.options.compat_macro_ifndef,
+                *lines,
+                '''#endif''', # end compat_macro
             ]
         else:
             return lines
 
-    def handle_include_brackets(self, line: str, match: re.Match[str] | None = None):
-        if self.convert_as_compat_header():
+    def handle_include_brackets(self, line: str, match: re.Match[str]):
+        if self._is_compat_header:
             self.add_compat_include(line)
         self.add_module_import_from_include(line, match, False)
         # self.add_global_module_fragment(line)
 
-    def handle_include_quote(self, line: str, match: re.Match[str] | None = None):
-        if self.convert_as_compat_header():
+    def handle_include_quote(self, line: str, match: re.Match[str]):
+        if self._is_compat_header:
             self.add_compat_include(line)
         self.add_module_import_from_include(line, match, True)
 
     def handle_pragma_once(self, line: str):
         self._add_module_staging(f'''// {line}''', 0)
 
-    def add_module_import_from_include(self, line: str, match: re.Match[str] | None = None, is_quote: bool = False):
+    def add_module_import_from_include(self, line: str, match: re.Match[str], is_quote: bool):
         self.set_module_purview_start()
-        if not match:
-            match = preprocessor_include_quote_rx.match(line)
-        if not match:
-            print('warning: preprocessor_include_local_rx not matched')
-            self.add_module_content(line)
-            return
-
-        line_space1 = match[1]
-        line_space2 = match[1]
-        line_include_filename = match[3]
-        line_tail = match[4]
+        line_space1 = match['lead']
+        line_space2 = match['lead']
+        line_include_filename = match['qhdr'] if is_quote else match['bhdr']
+        line_tail = match['tail']
 
         resolved_include_filename = self.resolver.resolve_include(line_include_filename, is_quote)
         if resolved_include_filename is None:
             self.add_global_module_fragment(line)
             return
-        if any_pattern_maches(self.options.always_include_names, resolved_include_filename):
-            self.add_global_module_fragment(line)
-            return
-        
-        line_module_name = self.resolver.resolve_include_to_module_name(line_include_filename, is_quote)
-        if line_module_name is None:
+        if self.options.matches_always_include(resolved_include_filename.as_posix()):
             self.add_global_module_fragment(line)
             return
+
+        line_module_name = self.parent_resolver.convert_filename_to_module_name(resolved_include_filename)
         if line_module_name == self.module_name:
             self.set_is_actually_module()
             self.set_module_purview_start()
@@ -596,18 +884,21 @@ class ModuleBaseBuilder(FileBaseBuilder):
         self._flush_module_staging()
         self._mark_module_interface_unit_export()
         parts = [
-            new_line.join(self.file_copyright),
-            new_line.join(self.global_module_fragment_start),
-            new_line.join(self.global_module_fragment_compat_includes),
-            new_line.join(self.global_module_fragment_compat_end),
-            new_line.join(self.global_module_fragment),
-            new_line.join(self.module_purview_start),
-            # new_line.join(self.module_imports),
-            # new_line.join(self.module_purview_special_headers),
-            new_line.join(self.module_content),
+            self.file_copyright,
+            self.global_module_fragment_start,
+            self.global_module_fragment_compat_includes,
+            self.global_module_fragment_compat_end,
+            self.global_module_fragment,
+            self.module_purview_start,
+            # self.module_imports,
+            # self.module_purview_special_headers,
+            self.module_content,
             ]
-        parts = filter(None, parts) # remove empty parts
-        return new_line.join(parts) + new_line
+        lines: StrList = []
+        for part in parts:
+            if len(part) > 1 or part and part[0]: # skip parts which would be joined to empty string
+                lines.extend(part)
+        return new_line.join(lines) + new_line
 
 class ModuleInterfaceUnitBuilder(ModuleBaseBuilder):
     content_type = ContentType.MODULE_INTERFACE
@@ -681,11 +972,13 @@ module <name>;             // Start of module purview.
 
 class CompatHeaderBuilder(FileBaseBuilder):
     content_type = ContentType.HEADER
-    def __init__(self, options: Options, module_builder: ModuleBaseBuilder):
+    def __init__(self, options: Options, module_builder: ModuleBaseBuilder, module_interface_unit_filename: str = ''):
+        '''module_interface_unit_filename is the already converted filename of module_builder, resolved when not provided'''
         super().__init__(options, module_builder.parent_resolver)
         self.module_builder: ModuleBaseBuilder = module_builder
         assert(module_builder.content_type == ContentType.MODULE_INTERFACE)
-        module_interface_unit_filename: str = module_builder.converted_filename()
+        if not module_interface_unit_filename:
+            module_interface_unit_filename = module_builder.converted_filename()
         assert(module_interface_unit_filename)
         self.relative_module_interface_unit_filename: str = os.path.basename(module_interface_unit_filename)
 
@@ -695,7 +988,7 @@ class CompatHeaderBuilder(FileBaseBuilder):
         relative_module_interface_unit_filename = self.relative_module_interface_unit_filename
         parts = [
             f'''#pragma once''',
-            f'''#ifndef {compat_macro}''',
+            self.options.compat_macro_ifndef,
             f'''#define {compat_macro}''',
             f'''#include "{relative_module_interface_unit_filename}"''',
             f'''#undef {compat_macro}''',
@@ -705,31 +998,112 @@ class CompatHeaderBuilder(FileBaseBuilder):
         ]
         return new_line.join(parts) + new_line
 
-class HeaderScanState(enum.Enum):
-    START = enum.auto()
-    FILE_COMMENT = enum.auto()
-    MAIN = enum.auto()
+comment_prefixes = ('//', '/*')
+bom_comment_prefixes = ('\ufeff//', '\ufeff/*')
+file_comment_prefixes = comment_prefixes + bom_comment_prefixes
 
-class Matcher:
-    def __init__(self):
-        self.rx: re.Pattern[str] | None = None
-        self.matched: re.Match[str] | None = None
-    def match(self, rx: re.Pattern[str], s: str) -> re.Match[str] | None:
-        self.rx = rx
-        self.matched = self.rx.match(s)
-        return self.matched
+def is_comment_line_start(line: str) -> bool:
+    '''empty line or comment, possibly after byte order mark'''
+    return not line or line.startswith(file_comment_prefixes)
+
+def is_file_comment_continuation(line: str) -> bool:
+    '''empty or whitespace only line, comment or block comment continuation, comments may be indented'''
+    stripped = line.strip()
+    if not stripped:
+        return True
+    return stripped.startswith(comment_prefixes) or stripped.startswith('*') or line.startswith(bom_comment_prefixes)
+
+def scan_lines(content_lines: StrList, builder: ModuleBaseBuilder):
+    '''feed header or source lines to module builder.
+    file comment lines at start are consumed first, then main loop runs without any state checks.
+    line kinds are dispatched inline to bound handler methods held in locals, most frequent kinds first'''
+    lines = join_continued_lines(content_lines)
+    file_comment_end = 0
+    if lines and is_comment_line_start(lines[0]):
+        add_file_copyright = builder.add_file_copyright
+        for line in lines:
+            if not is_file_comment_continuation(line):
+                break
+            add_file_copyright(line)
+            file_comment_end += 1
+    if file_comment_end:
+        lines = lines[file_comment_end:]
+
+    classify = classify_line
+    handle_main_content = builder.handle_main_content
+    handle_preprocessor = builder.handle_preprocessor
+    handle_include_brackets = builder.handle_include_brackets
+    handle_include_quote = builder.handle_include_quote
+    main_kind = LineKind.MAIN
+    preprocessor_kind = LineKind.PREPROCESSOR
+    include_brackets_kind = LineKind.INCLUDE_BRACKETS
+    include_quote_kind = LineKind.INCLUDE_QUOTE
+    preprocessor_if_kind = LineKind.PREPROCESSOR_IF
+    preprocessor_endif_kind = LineKind.PREPROCESSOR_ENDIF
+    for line in lines:
+        kind, match = classify(line)
+        if kind is main_kind:
+            handle_main_content(line)
+        elif kind is preprocessor_kind:
+            handle_preprocessor(line, 0)
+        elif kind is include_brackets_kind:
+            handle_include_brackets(line, cast(re.Match[str], match))
+        elif kind is include_quote_kind:
+            handle_include_quote(line, cast(re.Match[str], match))
+        elif kind is preprocessor_if_kind:
+            handle_preprocessor(line, 1)
+        elif kind is preprocessor_endif_kind:
+            handle_preprocessor(line, -1)
+        else:
+            builder.handle_pragma_once(line)
+
+def join_continued_lines(content_lines: StrList) -> StrList:
+    '''join lines ending with backslash \\ with following lines in a single pass.
+    returns content_lines itself when no line continues'''
+    if not any(line[-1:] == '\\' for line in content_lines):
+        return content_lines
+    joined_lines: StrList = []
+    continued_lines: StrList = []
+    for line in content_lines:
+        if line[-1:] == '\\':
+            continued_lines.append(line)
+        elif continued_lines:
+            continued_lines.append(line)
+            joined_lines.append(new_line.join(continued_lines))
+            continued_lines = []
+        else:
+            joined_lines.append(line)
+    if continued_lines:
+        joined_lines.append(new_line.join(continued_lines))
+    return joined_lines
+
+FileToConvert: TypeAlias = tuple[Path, FileOptions]
+FileToConvertList: TypeAlias = list[FileToConvert]
+ConverterCounters: TypeAlias = tuple[int, int, int, int]
 
 class Converter:
 
-    def __init__(self, action: ConvertAction):
+    def __init__(self, action: ConvertAction, options: Options | None = None):
         self.action = action
-        self.options = Options()
+        self.options = options if options is not None else Options()
         self.resolver = FilesResolver(self.options)
+        self.jobs: int = 1 # number of worker processes used by convert_directory
+        self.verbose: bool = True # print conversion progress
+        self.read_ahead: int = 0 # number of files read by background threads ahead of conversion, used when jobs == 1
         self.all_files = 0
         self.convertable_files = 0
         self.converted_files = 0
         self.copied_files = 0
         self.module_interface_builders: dict[str, ModuleInterfaceUnitBuilder] = {}
+
+    def get_counters(self) -> ConverterCounters:
+        return (self.all_files, self.convertable_files, self.converted_files, self.copied_files)
+
+    def add_counters(self, counters: ConverterCounters):
+        self.all_files += counters[0]
+        self.convertable_files += counters[1]
+        self.converted_files += counters[2]
+        self.copied_files += counters[3]
     
     def convert_file_content_to_module(self, content: str, filename: Path, content_type: ContentType, file_options: FileOptions) -> FileContentList:
         if content_type in {ContentType.MODULE_INTERFACE, ContentType.MODULE_IMPL}:
@@ -737,73 +1111,22 @@ class Converter:
         content_lines = content.splitlines()
 
         builder = self.make_builder_to_module(filename, content_type, file_options)
+        scan_lines(content_lines, builder)
 
-        is_comment = lambda: (not line
-            or line2 == '//'
-            or line2 == '/*'
-            or line3 == '\ufeff//'
-            or line3 == '\ufeff/*')
-
-        scanState = HeaderScanState.START
-        i = 0
-        while i < len(content_lines):
-            line = content_lines[i]
-            while line and line[-1] == '\\' and i+1 < len(content_lines):
-                # handle backslash \ as last character on line -- line continues on next line
-                i += 1
-                line += new_line + content_lines[i]
-            line2 = line[0:2]
-            line3 = line[0:3]
-            if scanState == HeaderScanState.START:
-                    if is_comment():
-                        scanState = HeaderScanState.FILE_COMMENT
-                        continue
-                    else:
-                        scanState = HeaderScanState.MAIN
-                        continue
-            elif scanState == HeaderScanState.FILE_COMMENT:
-                    line2 = line.strip()[0:2] 
-                    if (is_comment()
-                        or line2[0] == '*'
-                        ):
-                        builder.add_file_copyright(line)
-                    else:
-                        scanState = HeaderScanState.MAIN
-                        continue
-            elif scanState == HeaderScanState.MAIN:
-                    m = Matcher()
-                    if m.match(preprocessor_include_brackets_rx, line):
-                        builder.handle_include_brackets(line, m.matched)
-                    elif m.match(preprocessor_include_quote_rx, line):
-                        builder.handle_include_quote(line, m.matched)
-                    elif m.match(preprocessor_pragma_once_rx, line):
-                        builder.handle_pragma_once(line)
-                    elif (m.match(preprocessor_line_comment_rx, line)
-                          or m.match(preprocessor_other_rx, line)
-                          or m.match(spaces_rx, line)):
-                        builder.handle_preprocessor(line, 0)
-                    elif (m.match(preprocessor_define_rx, line)):
-                        builder.handle_preprocessor(line, 0)
-                    elif m.match(preprocessor_if_rx, line):
-                        builder.handle_preprocessor(line, 1)
-                    elif m.match(preprocessor_endif_rx, line):
-                        builder.handle_preprocessor(line, -1)
-                    else:
-                        builder.handle_main_content(line)
-            i += 1
-
-        result: FileContentList = []
-        result.append(builder.build_file_content())
-
-        if file_options.convert_as_compat and builder.content_type == ContentType.MODULE_INTERFACE:
-            compat_header_builder = CompatHeaderBuilder(self.options, builder)
-            compat_header_builder.set_source_filename(Path(filename))
+        module_file_content = builder.build_file_content()
+        result: FileContentList = [module_file_content]
+
+        if builder.convert_as_compat_header():
+            # compat header only refers to module interface unit, content is not scanned again
+            compat_header_builder = CompatHeaderBuilder(self.options, builder, module_file_content.filename.name)
+            compat_header_builder.set_source_filename(filename)
             result.append(compat_header_builder.build_file_content())
 
         return result
     
     def make_builder_to_module(self, filename: str|Path, content_type: ContentType, file_options: FileOptions|None = None) -> ModuleBaseBuilder:
-        filename = Path(filename)
+        if not isinstance(filename, Path):
+            filename = Path(filename)
         if not file_options:
             file_options = FileOptions()
         if content_type == ContentType.HEADER:
@@ -826,12 +1149,16 @@ class Converter:
             return [FileContent(filename, content_type, content)]
         return [FileContent(filename, content_type, content)]
 
-    def convert_file_content(self, content: str, filename: str|Path, file_options: FileOptions|None = None) -> FileContentList:
-        filename = Path(filename)
+    def convert_file_content(self, content: str, filename: str|Path, file_options: FileOptions|None = None,
+                             content_type: ContentType | None = None) -> FileContentList:
+        '''content_type is source content type of filename, resolved from its extension when not provided'''
+        if not isinstance(filename, Path):
+            filename = Path(filename)
         if file_options is None:
             file_options = FileOptions()
         action = self.action
-        content_type = self.resolver.get_source_content_type(action, filename)
+        if content_type is None:
+            content_type = self.resolver.get_source_content_type(action, filename)
         if action == ConvertAction.MODULES:
             return self.convert_file_content_to_module(content, filename, content_type, file_options)
         elif action == ConvertAction.HEADERS:
@@ -839,97 +1166,226 @@ class Converter:
         else:
             raise RuntimeError(f'Unknown action: "{action}"')
 
-    def convert_file(self, source_directory: Path, destination_directory: Path, filename: Path, file_options: FileOptions) -> FileContentList:
+    def read_source_file(self, source_directory: Path, filename: Path) -> str:
+        with open(os.path.join(source_directory, filename), buffering=self.options.io_buffer_size) as source_file:
+            return source_file.read()
+
+    def convert_file(self, source_directory: Path, destination_directory: Path, filename: Path, file_options: FileOptions,
+                     source_content: str | None = None, content_type: ContentType | None = None) -> FileContentList:
         self.convertable_files += 1
-        with open(source_directory.joinpath(filename)) as source_file:
-            source_content = source_file.read()
-        converted_files = self.convert_file_content(source_content, filename, file_options)
+        if source_content is None:
+            source_content = self.read_source_file(source_directory, filename)
+        converted_files = self.convert_file_content(source_content, filename, file_options, content_type)
         for converted_file in converted_files:
             converted_content = converted_file.content
             converted_filename = converted_file.filename
-            self._create_or_update_file_content_if_diff(destination_directory.joinpath(converted_filename), converted_content)
+            self._create_or_update_file_content_if_diff(os.path.join(destination_directory, converted_filename), converted_content)
         return converted_files
     
-    def _create_or_update_file_content_if_diff(self, file_path: Path, content: str):
-        if file_path.exists():
-            with open(file_path, 'r') as existing_destination_file:
-                existing_file_content = existing_destination_file.read()
-                if existing_file_content == content:
-                    return
-        with open(file_path, 'w') as destination_file:
+    def _create_or_update_file_content_if_diff(self, file_path: str, content: str):
+        if self._file_content_equals(file_path, content):
+            return
+        with open(file_path, 'w', buffering=self.options.io_buffer_size) as destination_file:
             destination_file.write(content)
         self.converted_files += 1
 
-    def convert_or_copy_file(self, source_directory: Path, destination_directory: Path, filename: Path, file_options: FileOptions):
+    def is_copied_as_is(self, filename: Path, content_type: ContentType | None = None) -> bool:
+        if content_type is None:
+            content_type = self.resolver.get_source_content_type(self.action, filename)
+        return content_type == ContentType.OTHER or self.options.matches_always_include(filename.as_posix())
+
+    def convert_or_copy_file(self, source_directory: Path, destination_directory: Path, filename: Path, file_options: FileOptions,
+                             source_content: str | None = None):
         self.all_files += 1
         content_type = self.resolver.get_source_content_type(self.action, filename)
-        if content_type == ContentType.OTHER or any_pattern_maches(self.options.always_include_names, PurePosixPath(filename)):
-            self._copy_file_content_if_diff(source_directory.joinpath(filename), destination_directory.joinpath(filename))
+        if self.is_copied_as_is(filename, content_type):
+            self._copy_file_content_if_diff(os.path.join(source_directory, filename), os.path.join(destination_directory, filename))
         else:
-            print('converting', filename)
-            converted_files = self.convert_file(source_directory, destination_directory, filename, file_options)
-            for converted_file in converted_files:
-                print('converted ', converted_file.filename, '\t', converted_file.content_type)
-
-    def _copy_file_content_if_diff(self, source_file_path: Path, destination_file_path: Path):
-        with open(source_file_path, 'rb') as source_file:
-            source_file_content = source_file.read()
-        if destination_file_path.exists():
-            with open(destination_file_path, 'rb') as existing_destination_file:
-                existing_file_content = existing_destination_file.read()
-                if existing_file_content == source_file_content:
-                    return
+            if self.verbose:
+                print('converting', filename)
+            converted_files = self.convert_file(source_directory, destination_directory, filename, file_options, source_content, content_type)
+            if self.verbose:
+                for converted_file in converted_files:
+                    print('converted ', converted_file.filename, '\t', converted_file.content_type)
+
+    def _file_content_equals(self, file_path: str, content: str) -> bool:
+        '''compares text file with content chunk by chunk, stops reading at first difference.
+        file is not opened when it is smaller than content, every character takes at least one byte'''
+        chunk_size = self.options.io_buffer_size
+        try:
+            if os.stat(file_path).st_size < len(content):
+                return False
+            existing_file = open(file_path, 'r', buffering=chunk_size)
+        except FileNotFoundError:
+            return False
+        with existing_file:
+            position = 0
+            while True:
+                chunk = existing_file.read(chunk_size)
+                if not chunk:
+                    return position == len(content)
+                if not content.startswith(chunk, position):
+                    return False
+                position += len(chunk)
+
+    def _copy_file_content_if_diff(self, source_file_path: str, destination_file_path: str):
+        if self._files_content_equals(source_file_path, destination_file_path):
+            return
         shutil.copy2(source_file_path, destination_file_path)
         self.copied_files += 1
 
+    def _files_content_equals(self, file_path1: str, file_path2: str) -> bool:
+        '''compares sizes first, then binary content chunk by chunk, stops reading at first difference'''
+        try:
+            size2 = os.stat(file_path2).st_size
+        except FileNotFoundError:
+            return False
+        if os.stat(file_path1).st_size != size2:
+            return False
+        chunk_size = self.options.io_buffer_size
+        with open(file_path1, 'rb', buffering=chunk_size) as file1, open(file_path2, 'rb', buffering=chunk_size) as file2:
+            while True:
+                chunk1 = file1.read(chunk_size)
+                if chunk1 != file2.read(chunk_size):
+                    return False
+                if not chunk1:
+                    return True
+
     def convert_directory(self, source_directory: Path, destination_directory: Path):
         if self.options.root_dir and self.options.root_dir != Path() and source_directory != self.options.root_dir:
             self.add_filesystem_directory(self.options.root_dir)
-            self.convert_directory_impl(self.options.root_dir, destination_directory, source_directory.relative_to(self.options.root_dir), FileOptions())
+            files = self.convert_directory_impl(self.options.root_dir, destination_directory, source_directory.relative_to(self.options.root_dir), FileOptions())
+            self.convert_files(self.options.root_dir, destination_directory, files)
         else:
             self.add_filesystem_directory(source_directory)
-            self.convert_directory_impl(source_directory, destination_directory, Path(), FileOptions())
+            files = self.convert_directory_impl(source_directory, destination_directory, Path(), FileOptions())
+            self.convert_files(source_directory, destination_directory, files)
 
     def add_filesystem_directory(self, directory: Path):
-        print('adding filesystem directory', directory)
+        if self.verbose:
+            print('adding filesystem directory', directory)
         self.resolver.files_map.add_filesystem_directory(directory)
 
-    def convert_directory_impl(self, source_directory: Path, destination_directory: Path, subdir: Path, file_options: FileOptions):
-        source_directory_w_subdir = source_directory.joinpath(subdir or '')
-        destination_directory_w_subdir = destination_directory.joinpath(subdir or '')
-        destination_directory_w_subdir.mkdir(parents=True, exist_ok=True)
-        for filepath in sorted(source_directory_w_subdir.iterdir(),
-                               key = lambda filepath: self.interface_then_impl_key(filepath)):
-            filename = filepath.relative_to(source_directory)
-            if any_pattern_maches(self.options.skip_patterns, PurePosixPath(filename)):
-                print(f'skipping "{filename}"')
+    def convert_directory_impl(self, source_directory: Path, destination_directory: Path, subdir: Path, file_options: FileOptions) -> Iterator[FileToConvert]:
+        '''walks subdir of source directory depth first, creates destination directories
+        and yields files to convert in conversion order'''
+        subdir_str = subdir.as_posix() if subdir != Path() else ''
+        walk: list[tuple[Iterator[os.DirEntry[str]], str, FileOptions]] = [
+            (self._scan_directory(source_directory, destination_directory, subdir_str), subdir_str, file_options),
+        ]
+        while walk:
+            entries, dir_name, dir_file_options = walk[-1]
+            entry = next(entries, None)
+            if entry is None:
+                walk.pop()
                 continue
-            next_file_options = self.make_next_file_options(file_options, filename)
-            if filepath.is_file():
-                self.convert_or_copy_file(source_directory, destination_directory, filename, next_file_options)
-            if filepath.is_dir():
-                self.convert_directory_impl(source_directory, destination_directory, filename, next_file_options)
-
-    def interface_then_impl_key(self, file_path: Path):
+            filename = f'{dir_name}/{entry.name}' if dir_name else entry.name
+            if self.options.matches_skip_patterns(filename):
+                if self.verbose:
+                    print(f'skipping "{filename}"')
+                continue
+            next_file_options = self.make_next_file_options(dir_file_options, filename)
+            # DirEntry type checks use d_type from directory read, stat is needed only for symlinks
+            if entry.is_file():
+                yield (Path(filename), next_file_options)
+            elif entry.is_dir():
+                walk.append((self._scan_directory(source_directory, destination_directory, filename), filename, next_file_options))
+
+    def _scan_directory(self, source_directory: Path, destination_directory: Path, subdir: str) -> Iterator[os.DirEntry[str]]:
+        destination_directory.joinpath(subdir).mkdir(parents=True, exist_ok=True)
+        interface_then_impl_key = self.interface_then_impl_key
+        with os.scandir(source_directory.joinpath(subdir)) as scanned_entries:
+            # names are unique in directory so entries themselves are never compared
+            decorated_entries = [(interface_then_impl_key(entry.name), entry.name, entry) for entry in scanned_entries]
+        decorated_entries.sort()
+        return (entry for _, _, entry in decorated_entries)
+
+    def convert_files(self, source_directory: Path, destination_directory: Path, files: Iterable[FileToConvert]):
+        if self.jobs <= 1 and self.read_ahead > 0:
+            self.convert_files_reading_ahead(source_directory, destination_directory, files)
+            return
+        if self.jobs <= 1:
+            for filename, file_options in files:
+                self.convert_or_copy_file(source_directory, destination_directory, filename, file_options)
+            return
+        # module interface and implementation units of the same module must be converted by the same worker
+        # in order, since implementation unit reuses global module fragment of the interface unit
+        modules_files: dict[str, FileToConvertList] = {}
+        for file in files:
+            module_key, _ = split_extension(str(file[0]))
+            modules_files.setdefault(module_key, []).append(file)
+        from concurrent.futures import ProcessPoolExecutor # loads multiprocessing, only needed for jobs > 1
+        # forked workers inherit unflushed output buffers and would print them again
+        sys.stdout.flush()
+        with ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_convert_worker,
+                                 initargs=(self.action, self.options, self.resolver.files_map, self.verbose)) as executor:
+            futures = [executor.submit(_convert_files_in_worker, source_directory, destination_directory, batch_files)
+                       for batch_files in self._batch_modules_files(list(modules_files.values()))]
+            for future in futures:
+                self.add_counters(future.result())
+
+    def _batch_modules_files(self, modules_files: list[FileToConvertList]) -> list[FileToConvertList]:
+        '''joins files of consecutive modules into batches, several batches per worker to balance load
+        while avoiding a task round trip per module'''
+        batch_modules_count = max(1, len(modules_files) // (self.jobs * JOB_BATCHES_PER_WORKER))
+        batches: list[FileToConvertList] = []
+        for i in range(0, len(modules_files), batch_modules_count):
+            batch_files: FileToConvertList = []
+            for module_files in modules_files[i:i + batch_modules_count]:
+                batch_files.extend(module_files)
+            batches.append(batch_files)
+        return batches
+
+    def convert_files_reading_ahead(self, source_directory: Path, destination_directory: Path, files: Iterable[FileToConvert]):
+        '''converts files in order while next files to convert are read by background threads'''
+        from concurrent.futures import ThreadPoolExecutor
+        pending: deque[tuple[Path, FileOptions, Future[str] | None]] = deque()
+        with ThreadPoolExecutor(max_workers=self.read_ahead) as executor:
+            for filename, file_options in files:
+                source_content_future = None
+                if not self.is_copied_as_is(filename):
+                    source_content_future = executor.submit(self.read_source_file, source_directory, filename)
+                pending.append((filename, file_options, source_content_future))
+                if len(pending) > self.read_ahead:
+                    self._convert_pending_file(source_directory, destination_directory, pending.popleft())
+            while pending:
+                self._convert_pending_file(source_directory, destination_directory, pending.popleft())
+
+    def _convert_pending_file(self, source_directory: Path, destination_directory: Path, pending_file: tuple[Path, FileOptions, Future[str] | None]):
+        filename, file_options, source_content_future = pending_file
+        source_content = source_content_future.result() if source_content_future else None
+        self.convert_or_copy_file(source_directory, destination_directory, filename, file_options, source_content)
+
+    def interface_then_impl_key(self, file_path: str|Path):
         content_type = self.resolver.get_source_content_type(self.action, file_path)
         if content_type in interface_content_types:
             return 0
         return 1
 
 
-    def make_next_file_options(self, file_options: FileOptions, filename: Path):
+    def make_next_file_options(self, file_options: FileOptions, filename: str):
+        '''file options are never modified after creation, so they are shared unless compat mode starts here'''
+        if file_options.convert_as_compat or not self.options.matches_compat_patterns(filename):
+            return file_options
         next_file_options = copy.copy(file_options)
-        if not file_options.convert_as_compat:
-            convert_as_compat = any_pattern_maches(self.options.compat_patterns, PurePosixPath(filename))
-            if convert_as_compat:
-                next_file_options.convert_as_compat = convert_as_compat
+        next_file_options.convert_as_compat = True
         return next_file_options
 
-def any_pattern_maches(patterns: list[str], filename: PurePosixPath) -> bool:
-    for skip_pattern in patterns:
-        if filename.match(skip_pattern):
-            return True
-    return False
+_worker_converter: Converter | None = None
+
+def _init_convert_worker(action: ConvertAction, options: Options, files_map: FilesMap, verbose: bool):
+    global _worker_converter
+    _worker_converter = Converter(action, options)
+    _worker_converter.verbose = verbose
+    _worker_converter.resolver.files_map = files_map
+
+def _convert_files_in_worker(source_directory: Path, destination_directory: Path, files: FileToConvertList) -> ConverterCounters:
+    converter = _worker_converter
+    assert(converter)
+    converter.all_files = converter.convertable_files = converter.converted_files = converter.copied_files = 0
+    for filename, file_options in files:
+        converter.convert_or_copy_file(source_directory, destination_directory, filename, file_options)
+    return converter.get_counters()
 
 def convert_file_content(action: ConvertAction, content: str, filename: str) -> str:
     converter = Converter(action)
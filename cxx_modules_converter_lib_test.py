@@ -2,6 +2,7 @@ import os
 import os.path
 from pathlib import Path, PurePosixPath
 import pytest
+import warnings
 from .cxx_modules_converter_lib import (
     Converter,
     convert_file_content,
@@ -15,6 +16,13 @@ from .cxx_modules_converter_lib import (
     FilesResolver,
     ModuleFilesResolver,
     FileContent,
+    PatternsMatcher,
+    compile_patterns,
+    LineKind,
+    classify_line,
+    normalize_posix_path,
+    join_posix_path,
+    split_extension,
     )
 
 def test_module_empty():
@@ -858,6 +866,43 @@ def test_FilesMap_add_map():
         },
     })
 
+def test_FilesMap_find():
+    files_map = FilesMap()
+    files_map.add_files_map_dict({
+        'simple1.h': FileEntryType.FILE,
+        'subdir1': {
+            'simple2.h': FileEntryType.FILE,
+        },
+        'empty': {},
+    })
+    assert(files_map.find(PurePosixPath('simple1.h')) == FileEntryType.FILE)
+    assert(files_map.find(PurePosixPath('subdir1/simple2.h')) == FileEntryType.FILE)
+    assert(files_map.find(PurePosixPath('subdir1')) == {'simple2.h': FileEntryType.FILE})
+    assert(not files_map.find(PurePosixPath('empty')))
+    assert(files_map.find(PurePosixPath('simple2.h')) is None)
+    assert(files_map.find(PurePosixPath('subdir1/simple1.h')) is None)
+    assert(files_map.find(PurePosixPath('missing/simple1.h')) is None)
+    files_map.add_files_map_dict({
+        'subdir1': {
+            'simple3.h': FileEntryType.FILE,
+        },
+    })
+    assert(files_map.find(PurePosixPath('subdir1/simple2.h')) is None)
+    assert(files_map.find(PurePosixPath('subdir1/simple3.h')) == FileEntryType.FILE)
+
+def test_posix_path_strings_same_as_PurePosixPath():
+    paths = ['a.h', './a.h', 'a//b.h', 'a/./b.h', 'a/', '.', '', '/', '/usr/a.h', '../a.h']
+    for path in paths:
+        assert(normalize_posix_path(path) == PurePosixPath(path).as_posix())
+        for directory in ['.', 'subdir', 'subdir/subdir2', '/', '/usr']:
+            normalized = normalize_posix_path(path)
+            assert(join_posix_path(directory, normalized) == PurePosixPath(directory).joinpath(normalized).as_posix())
+
+def test_split_extension_same_as_splitext():
+    filenames = ['simple.h', '.h', '..h', 'simple..h', 'subdir.d/simple', 'subdir/.simple', 'subdir/simple.cppm.h', '', '.', 'simple.']
+    for filename in filenames:
+        assert(split_extension(filename) == os.path.splitext(filename))
+
 def test_FilesResolver_resolve_in_search_path_empty_map():
     options = Options()
     files_resolver = FilesResolver(options)
@@ -866,6 +911,19 @@ def test_FilesResolver_resolve_in_search_path_empty_map():
     assert(files_resolver.resolve_in_search_path(Path('subdir1'), 'test', 'simple1.h', True) == PurePosixPath('simple1.h'))
     assert(files_resolver.resolve_in_search_path(Path('subdir1'), 'test', 'simple1.h', False) is None)
 
+def test_FilesResolver_resolve_in_search_path_cache_invalidated():
+    options = Options()
+    files_resolver = FilesResolver(options)
+    assert(files_resolver.resolve_in_search_path(Path('subdir1'), 'test', 'simple1.h', True) == PurePosixPath('simple1.h'))
+    files_resolver.files_map.add_files_map_dict({
+        'subdir1': {
+            'simple1.h': FileEntryType.FILE,
+        },
+    })
+    assert(files_resolver.resolve_in_search_path(Path('subdir1'), 'test', 'simple1.h', True) == PurePosixPath('subdir1/simple1.h'))
+    assert(files_resolver.resolve_in_search_path(Path(''), 'test', 'simple1.h', False) is None)
+    options.search_path.append('subdir1')
+    assert(files_resolver.resolve_in_search_path(Path(''), 'test', 'simple1.h', False) == PurePosixPath('subdir1/simple1.h'))
 
 def test_ModuleFilesResolver_resolve_in_search_path():
     options = Options()
@@ -937,6 +995,8 @@ def test_FilesResolver_convert_filename_to_module_name():
     assert(files_resolver.convert_filename_to_module_name(PurePosixPath('root.h')) == 'org.root')
     assert(files_resolver.convert_filename_to_module_name(PurePosixPath('subdir1/simple1.h')) == 'org.subdir1.simple1')
     assert(files_resolver.convert_filename_to_module_name(PurePosixPath('missing.h')) == 'missing')
+    assert(files_resolver.convert_filename_to_module_name('subdir1/simple1.h') == 'org.subdir1.simple1')
+    assert(files_resolver.convert_filename_to_module_name('./subdir1//simple1.h') == 'org.subdir1.simple1')
 
 def test_FilesResolver_get_source_content_type():
     options = Options()
@@ -977,6 +1037,110 @@ def test_FilesResolver_convert_filename_to_content_type():
     assert(files_resolver.convert_filename_to_content_type(Path('test.h'), ContentType.MODULE_INTERFACE) == 'test.ixx')
     assert(files_resolver.convert_filename_to_content_type(Path('test.cpp'), ContentType.MODULE_IMPL) == 'test.cxx')
 
+def test_compile_patterns_same_as_path_match():
+    patterns = [
+        'simple.h',
+        'subdir/*',
+        '*.cpp',
+        'sub?ir',
+        '[sx]imple.h',
+        '[!s]imple.h',
+        '/simple.h',
+        './simple.h',
+        'a[b',
+    ]
+    # PurePosixPath.match of older pythons raises re.error for reversed ranges, so expected matches are listed
+    class_patterns_matches = {
+        '[z-a]': [],
+        '[!-*]': ['a', ']', 'subdir/]', '+', 'a/b'],
+        '[!]]': ['a', '-', '+', 'a/b'],
+        '*/[!]]': ['a/b'],
+        '[].--]': [']', 'subdir/]'],
+        '[a--]': [],
+        '[!z-a]': ['a', ']', 'subdir/]', '-', '+', 'a/b'],
+        'a[.-0]b': [],
+    }
+    filenames = [
+        'simple.h',
+        'ximple.h',
+        'subdir',
+        'subdir/simple.h',
+        'subdir/simple.cpp',
+        'dir/subdir/simple.h',
+        'subdir/subdir2/simple.h',
+        'a[b',
+        ']',
+        'subdir/]',
+        '-',
+        '+',
+        'a',
+        'a/b',
+    ]
+    for pattern in patterns:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            rx = compile_patterns([pattern])
+        assert(rx is not None)
+        for filename in filenames:
+            assert((rx.search(filename) is not None) == PurePosixPath(filename).match(pattern)), (pattern, filename)
+            assert(PatternsMatcher().matches([pattern], filename) == PurePosixPath(filename).match(pattern)), (pattern, filename)
+    for pattern, matching_filenames in class_patterns_matches.items():
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            rx = compile_patterns([pattern])
+        assert(rx is not None)
+        for filename in filenames:
+            assert((rx.search(filename) is not None) == (filename in matching_filenames)), (pattern, filename)
+            assert(PatternsMatcher().matches([pattern], filename) == (filename in matching_filenames)), (pattern, filename)
+    assert(compile_patterns([]) is None)
+    assert(not PatternsMatcher().matches([], 'simple.h'))
+    # patterns without parts never match, PurePosixPath.match raises ValueError for them
+    for pattern in ['.', './', './.']:
+        for filename in filenames + ['']:
+            assert(not PatternsMatcher().matches([pattern], filename)), (pattern, filename)
+
+def test_PatternsMatcher():
+    matcher = PatternsMatcher()
+    patterns: list[str] = []
+    assert(not matcher.matches(patterns, 'simple.h'))
+    patterns.append('*.h')
+    assert(matcher.matches(patterns, 'simple.h'))
+    assert(matcher.matches(patterns, 'subdir/simple.h'))
+    assert(not matcher.matches(patterns, 'simple.cpp'))
+    patterns[0] = 'subdir/*'
+    assert(not matcher.matches(patterns, 'simple.h'))
+    assert(matcher.matches(patterns, 'subdir/simple.h'))
+    patterns.append('cassert')
+    assert(matcher.matches(patterns, 'cassert'))
+    assert(matcher.matches(patterns, 'other/cassert'))
+    assert(not matcher.matches(patterns, 'cassert.h'))
+
+def test_Options_matches_always_include():
+    options = Options()
+    assert(options.matches_always_include('cassert'))
+    assert(options.matches_always_include('subdir/assert.h'))
+    assert(not options.matches_always_include('vector'))
+    options.always_include_names.append('config_*.h')
+    assert(options.matches_always_include('subdir/config_debug.h'))
+
+def test_classify_line():
+    assert(classify_line('int a;') == (LineKind.MAIN, None))
+    assert(classify_line('/* block */')[0] == LineKind.MAIN)
+    kind, match = classify_line(' # include <vector> // tail')
+    assert(kind == LineKind.INCLUDE_BRACKETS)
+    assert(match and (match['lead'], match['bhdr'], match['tail']) == (' ', 'vector', ' // tail'))
+    kind, match = classify_line('#include "local.h"')
+    assert(kind == LineKind.INCLUDE_QUOTE)
+    assert(match and match['qhdr'] == 'local.h')
+    assert(classify_line('#pragma once')[0] == LineKind.PRAGMA_ONCE)
+    assert(classify_line('#pragma warning')[0] == LineKind.PREPROCESSOR)
+    assert(classify_line('  // comment')[0] == LineKind.PREPROCESSOR)
+    assert(classify_line('  ')[0] == LineKind.PREPROCESSOR)
+    assert(classify_line('#define A 1')[0] == LineKind.PREPROCESSOR)
+    assert(classify_line('#elif A')[0] == LineKind.PREPROCESSOR)
+    assert(classify_line('#ifdef A')[0] == LineKind.PREPROCESSOR_IF)
+    assert(classify_line('# endif // A')[0] == LineKind.PREPROCESSOR_ENDIF)
+
 def test_module_impl_include_local_self_header_subdir():
     converter = Converter(ConvertAction.MODULES)
     converter.resolver.files_map.add_files_map_dict({
@@ -1180,6 +1344,31 @@ export module empty;
 '''),
 ])
 
+def test_module_interface_compat_header_empty_compat_macro():
+    converter = Converter(ConvertAction.MODULES)
+    converter.options.compat_macro = 'MY_COMPAT'
+    file_options = FileOptions()
+    file_options.convert_as_compat = True
+    converted = converter.convert_file_content(
+'''''', 'empty.h', file_options)
+    assert(converted == [
+        FileContent("empty.cppm", ContentType.MODULE_INTERFACE,
+'''#ifndef MY_COMPAT
+export module empty;
+#endif
+'''),
+        FileContent("empty.h", ContentType.HEADER,
+'''#pragma once
+#ifndef MY_COMPAT
+#define MY_COMPAT
+#include "empty.cppm"
+#undef MY_COMPAT
+#else
+#include "empty.cppm"
+#endif
+'''),
+])
+
 def test_module_interface_compat_header():
     converter = Converter(ConvertAction.MODULES)
     file_options = FileOptions()
@@ -1484,3 +1673,143 @@ def test_dir_outext(dir_simple: Path):
         'simple.cxx',
         'simple2.hpp',
     ])
+
+def test_dir_jobs(dir_simple: Path):
+    data_directory = Path('test_data/compat')
+    converter = Converter(ConvertAction.MODULES)
+    converter.jobs = 2
+    converter.options.compat_patterns = [
+        'simple.h',
+        'simple.cpp',
+        'subdir/*',
+    ]
+    converter.convert_directory(data_directory.joinpath('input'), dir_simple)
+    assert_files(data_directory.joinpath('expected'), dir_simple, [
+        'simple.h',
+        'simple.cppm',
+        'simple.cpp',
+        'subdir/simple2.h',
+        'subdir/simple2.cppm',
+        'subdir/simple2.cpp',
+    ])
+    assert(converter.all_files == 4)
+    assert(converter.convertable_files == 4)
+    assert(converter.converted_files == 6)
+    assert(converter.copied_files == 0)
+
+def test_dir_read_ahead(dir_simple: Path):
+    data_directory = Path('test_data/twice')
+    converter = Converter(ConvertAction.MODULES)
+    converter.read_ahead = 2
+    converter.convert_directory(data_directory.joinpath('input'), dir_simple)
+    assert_files(data_directory.joinpath('expected'), dir_simple, [
+        'simple.cppm',
+        'simple.cpp',
+        'other.txt',
+    ])
+    assert(converter.all_files == 3)
+    assert(converter.convertable_files == 2)
+    assert(converter.converted_files == 2)
+    assert(converter.copied_files == 1)
+
+def test_module_define_continued_lines():
+    converted = convert_file_content(
+        ConvertAction.MODULES,
+'''#include <vector>
+#define A(x) \\
+    x + \\
+    1
+int a = A(1);
+''', 'simple.h')
+    assert(converted ==
+'''module;
+#include <vector>
+export module simple;
+export {
+#define A(x) \\
+    x + \\
+    1
+int a = A(1);
+} // export
+''')
+
+def test_module_define_continued_first_line():
+    converted = convert_file_content(
+        ConvertAction.MODULES,
+'''#define A(x) \\
+    x + \\
+    1
+int a = A(1);
+''', 'simple.h')
+    assert(converted ==
+'''export module simple;
+export {
+#define A(x) \\
+    x + \\
+    1
+int a = A(1);
+} // export
+''')
+
+def test_dir_twice_changed_small_buffer(dir_simple: Path):
+    data_directory = Path('test_data/twice')
+    converter = Converter(ConvertAction.MODULES)
+    converter.options.io_buffer_size = 4
+    converter.convert_directory(data_directory.joinpath('input'), dir_simple)
+    assert(converter.converted_files == 2)
+    assert(converter.copied_files == 1)
+    # same size, last character differs
+    for filename in ['simple.cppm', 'other.txt']:
+        content = dir_simple.joinpath(filename).read_text()
+        dir_simple.joinpath(filename).write_text(content[:-1] + '#')
+    converter = Converter(ConvertAction.MODULES)
+    converter.options.io_buffer_size = 4
+    converter.convert_directory(data_directory.joinpath('input'), dir_simple)
+    assert(converter.converted_files == 1)
+    assert(converter.copied_files == 1)
+    assert_files(data_directory.joinpath('expected'), dir_simple, [
+        'simple.cppm',
+        'simple.cpp',
+        'other.txt',
+    ])
+    converter = Converter(ConvertAction.MODULES)
+    converter.options.io_buffer_size = 4
+    converter.convert_directory(data_directory.joinpath('input'), dir_simple)
+    assert(converter.converted_files == 0)
+    assert(converter.copied_files == 0)
+
+def test_dir_twice_truncated(dir_simple: Path):
+    data_directory = Path('test_data/twice')
+    converter = Converter(ConvertAction.MODULES)
+    converter.convert_directory(data_directory.joinpath('input'), dir_simple)
+    assert(converter.converted_files == 2)
+    # shorter than converted content
+    content = dir_simple.joinpath('simple.cppm').read_text()
+    dir_simple.joinpath('simple.cppm').write_text(content[:-2])
+    converter = Converter(ConvertAction.MODULES)
+    converter.convert_directory(data_directory.joinpath('input'), dir_simple)
+    assert(converter.converted_files == 1)
+    assert(converter.copied_files == 0)
+    assert_files(data_directory.joinpath('expected'), dir_simple, [
+        'simple.cppm',
+        'simple.cpp',
+        'other.txt',
+    ])
+
+def test_module_file_comment_then_spaces_line():
+    converted = convert_file_content(
+        ConvertAction.MODULES,
+'''// comment
+   
+// more comment
+int a;
+''', 'simple.h')
+    assert(converted ==
+'''// comment
+   
+// more comment
+export module simple;
+export {
+int a;
+} // export
+''')